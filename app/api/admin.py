@@ -0,0 +1,43 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from app.utils import profiler
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Rejects requests without the configured admin token."""
+    if not profiler.is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+@router.get(
+    "/profiles",
+    summary="List stored request profiles",
+    description="Lists profiles captured for sampled, admin-requested (`X-Profile` header) or slow requests, newest first."
+)
+def get_profiles():
+    return profiler.list_profiles()
+
+@router.get(
+    "/profiles/{profile_id}",
+    summary="Get a stored request profile",
+    description="""Returns a single profile.
+
+**Contents:**
+- Per-stage timings, with external engine time (wkhtmltopdf, Aspose, MuPDF) reported separately
+- Sampled call stacks in collapsed format (one `a;b;c` stack per key, sample count as value)
+- Allocation peak in bytes while the request was running; `memory_peak_approximate` is true when other profiled requests overlapped it and shared the process-wide peak""",
+    responses={404: {"description": "Profile not found"}}
+)
+def get_profile(profile_id: str):
+    profile = profiler.load_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get(
+    "/slow-requests",
+    summary="List slow requests",
+    description="Returns the most recent requests that exceeded the slow-request threshold."
+)
+def get_slow_requests(limit: int = Query(100, ge=1, le=1000)):
+    return profiler.read_slow_log(limit)
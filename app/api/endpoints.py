@@ -17,7 +17,8 @@ router = APIRouter(tags=["Document Generation"])
 - Supports both PDF and DOCX formats
 - Customizable headers and footers
 - Watermark support with rotation and opacity control
-- Conditional footer placement""",
+- Conditional footer placement
+- PDF output optimization, with sizes and stage time in `X-PDF-Size-Before`, `X-PDF-Size-After` and `X-PDF-Optimization-Ms` headers""",
     responses={
         200: {
             "content": {
@@ -43,8 +44,14 @@ async def generate_document(request: DocumentRequest):
         HTTPException: If document generation fails
     """
     try:
+        headers = {}
         if request.document_type == "pdf":
-            file_path = generate_pdf(request)
+            file_path, stats = generate_pdf(request)
+            headers = {
+                "X-PDF-Size-Before": str(stats["size_before"]),
+                "X-PDF-Size-After": str(stats["size_after"]),
+                "X-PDF-Optimization-Ms": f"{stats['duration'] * 1000:.1f}",
+            }
         elif request.document_type == "docx":
             file_path = generate_docx(request)
         else:
@@ -54,7 +61,7 @@ async def generate_document(request: DocumentRequest):
             file_path,
             filename=os.path.basename(file_path),
             media_type="application/octet-stream",
-            headers={"Content-Disposition": f"attachment; filename={os.path.basename(file_path)}"}
+            headers={"Content-Disposition": f"attachment; filename={os.path.basename(file_path)}", **headers}
         )
     
     except Exception as e:
@@ -1,8 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.api.endpoints import router
+from app.api.admin import router as admin_router
 from app.utils.file_cleanup import cleanup_temp_files, _temp_files
+from app.utils.profiler import should_profile, start_profile, finish_profile
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -26,7 +28,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    if request.url.path.startswith("/admin"):
+        return await call_next(request)
+
+    profile = start_profile(request.method, request.url.path, should_profile(request.headers))
+    try:
+        response = await call_next(request)
+    finally:
+        profile_id = finish_profile(profile)
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
 app.include_router(router)
+app.include_router(admin_router)
 
 @app.get("/")
 def home():
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 from bs4 import BeautifulSoup
+from app.utils.profiler import profile_section
 
 class DocumentRequest(BaseModel):
     """Request model for document generation"""
@@ -34,18 +35,30 @@ class DocumentRequest(BaseModel):
     footer_last_page_only: Optional[bool] = Field(False, 
                                                 description="Show footer only on last page")
 
+    pdf_optimization: Optional[str] = Field("speed", example="balanced",
+                                          description="PDF output optimization preset: 'none', 'speed', 'balanced' or 'size'")
+
     @field_validator('document_type')
     def validate_document_type(cls, v):
         if v.lower() not in ['pdf', 'docx']:
             raise ValueError('document_type must be either "pdf" or "docx"')
         return v.lower()
     
+    @field_validator('pdf_optimization')
+    def validate_pdf_optimization(cls, v):
+        if v is None:
+            return "none"
+        if v.lower() not in ['none', 'speed', 'balanced', 'size']:
+            raise ValueError('pdf_optimization must be one of "none", "speed", "balanced" or "size"')
+        return v.lower()
+    
     @field_validator('content_html')
     def validate_content_html(cls, v):
         if not v.strip():
             raise ValueError('content_html cannot be empty')
         try:
-            BeautifulSoup(v, 'html.parser')
+            with profile_section("html_validation"):
+                BeautifulSoup(v, 'html.parser')
             return v
         except Exception as e:
             raise ValueError(f'Invalid HTML')
@@ -55,7 +68,8 @@ class DocumentRequest(BaseModel):
         if v is None:
             return v
         try:
-            BeautifulSoup(v, 'html.parser')
+            with profile_section("html_validation"):
+                BeautifulSoup(v, 'html.parser')
             return v
         except Exception as e:
             raise ValueError(f'Invalid HTML')
@@ -78,7 +92,8 @@ class DocumentRequest(BaseModel):
                 "watermark_height": 200,
                 "watermark_rotation": 45,
                 "watermark_opacity": 0.5,
-                "footer_last_page_only": False
+                "footer_last_page_only": False,
+                "pdf_optimization": "balanced"
             }
 
         }
\ No newline at end of file
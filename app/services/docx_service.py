@@ -3,6 +3,7 @@ import aspose.words
 import imgkit
 from app.models.request_models import DocumentRequest
 from app.utils.tempfile_manager import ManagedTempFile
+from app.utils.profiler import profile_section
 
 
 def generate_docx(request: DocumentRequest) -> str:
@@ -19,17 +20,21 @@ def generate_docx(request: DocumentRequest) -> str:
             # Add header if provided
             if request.header_html:
                 builder.move_to_header_footer(aw.HeaderFooterType.HEADER_PRIMARY)
-                builder.insert_html(request.header_html)
+                with profile_section("aspose_insert_header", external=True):
+                    builder.insert_html(request.header_html)
 
             # Add main content
             builder.move_to_section(0)
-            builder.insert_html(request.content_html)
+            with profile_section("aspose_insert_html", external=True):
+                builder.insert_html(request.content_html)
 
             # Add footer if provided
             if request.footer_html:
-                handle_docx_footer(doc, builder, request)
+                with profile_section("aspose_footer_layout", external=True):
+                    handle_docx_footer(doc, builder, request)
 
-            doc.save(temp_path)
+            with profile_section("aspose_save", external=True):
+                doc.save(temp_path)
             return temp_path
         
     except Exception as e:
@@ -48,7 +53,8 @@ def add_watermark(doc: aw.Document, builder: aw.DocumentBuilder, request: Docume
                 'quiet': '',
                 'transparent': ''
             }
-            imgkit.from_string(request.watermark_html, img_path, options=options)
+            with profile_section("wkhtmltoimage", external=True):
+                imgkit.from_string(request.watermark_html, img_path, options=options)
 
             # Create watermark shape
             watermark = aw.drawing.Shape(doc, aw.drawing.ShapeType.IMAGE)
@@ -1,12 +1,60 @@
+import logging
+import math
+import os
+import time
+import zlib
+from typing import Tuple
 import pdfkit
 import fitz  # PyMuPDF
 import imgkit
 from app.models.request_models import DocumentRequest
 from app.utils.tempfile_manager import ManagedTempFile
+from app.utils.profiler import profile_section
 
+logger = logging.getLogger(__name__)
 
-def generate_pdf(request: DocumentRequest) -> str:
-    """Generates a PDF file with proper HTML and watermark handling."""
+# Final optimization stage settings, keyed by DocumentRequest.pdf_optimization.
+# "speed" (the default) only rewrites and compresses losslessly; "size" also subsets fonts and
+# downsamples/recompresses every oversized image.
+PDF_OPTIMIZATION_PRESETS = {
+    "none": None,
+    "speed": {
+        "garbage": 3,
+        "deflate": True,
+        "deflate_images": False,
+        "deflate_fonts": False,
+        "use_objstms": 0,
+        "subset_fonts": False,
+        "image_dpi": None,
+        "recompress_lossless": False,
+    },
+    "balanced": {
+        "garbage": 4,
+        "deflate": True,
+        "deflate_images": True,
+        "deflate_fonts": True,
+        "use_objstms": 1,
+        "subset_fonts": True,
+        "image_dpi": 150,
+        "recompress_lossless": False,
+    },
+    "size": {
+        "garbage": 4,
+        "deflate": True,
+        "deflate_images": True,
+        "deflate_fonts": True,
+        "use_objstms": 1,
+        "subset_fonts": True,
+        "image_dpi": 96,
+        "recompress_lossless": True,
+    },
+}
+
+
+def generate_pdf(request: DocumentRequest) -> Tuple[str, dict]:
+    """Generates a PDF file with proper HTML and watermark handling.
+
+    Returns the file path and the optimization stage stats."""
     try:
         with ManagedTempFile(suffix='.pdf') as temp_path:
             # Generate base PDF
@@ -18,7 +66,8 @@ def generate_pdf(request: DocumentRequest) -> str:
                 'encoding': "UTF-8",
                 'quiet': ''
             }
-            pdfkit.from_string(construct_html(request), temp_path, options=options)
+            with profile_section("wkhtmltopdf", external=True):
+                pdfkit.from_string(construct_html(request), temp_path, options=options)
 
             # Apply watermark if needed
             if request.watermark_html:
@@ -28,7 +77,10 @@ def generate_pdf(request: DocumentRequest) -> str:
             if request.footer_html:
                 handle_pdf_footer(temp_path, request)
 
-            return temp_path
+            # Rewrite and compress the incrementally saved file
+            stats = optimize_pdf(temp_path, request.pdf_optimization)
+
+            return temp_path, stats
         
     except Exception as e:
         raise RuntimeError(f"PDF generation failed: ", str(e))
@@ -63,15 +115,16 @@ def apply_watermark(pdf_path: str, request: DocumentRequest):
                 'encoding': "UTF-8",
                 'quiet': ''
             }
-            imgkit.from_string(f"""
-                <div style="
-                    opacity: {request.watermark_opacity};
-                    width: 100%;
-                    height: 100%;
-                ">
-                    {request.watermark_html}
-                </div>
-                """, img_path, options=options)
+            with profile_section("wkhtmltoimage", external=True):
+                imgkit.from_string(f"""
+                    <div style="
+                        opacity: {request.watermark_opacity};
+                        width: 100%;
+                        height: 100%;
+                    ">
+                        {request.watermark_html}
+                    </div>
+                    """, img_path, options=options)
 
             # Apply to PDF
             doc = fitz.open(pdf_path)
@@ -84,20 +137,22 @@ def apply_watermark(pdf_path: str, request: DocumentRequest):
                 filename=img_path,
             )
 
-            for page in doc:
-                rect = page.rect
-                x = (rect.width - request.watermark_width) / 2
-                y = (rect.height - request.watermark_height) / 2
-
-                page.show_pdf_page(
-                    fitz.Rect(x, y, x + request.watermark_width, y + request.watermark_height),
-                    watermark_doc,
-                    0,
-                    rotate=request.watermark_rotation,
-                    overlay=False
-                )
+            with profile_section("show_pdf_page", external=True):
+                for page in doc:
+                    rect = page.rect
+                    x = (rect.width - request.watermark_width) / 2
+                    y = (rect.height - request.watermark_height) / 2
+
+                    page.show_pdf_page(
+                        fitz.Rect(x, y, x + request.watermark_width, y + request.watermark_height),
+                        watermark_doc,
+                        0,
+                        rotate=request.watermark_rotation,
+                        overlay=False
+                    )
             
-            doc.save(pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+            with profile_section("pdf_save", external=True):
+                doc.save(pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
             doc.close()
             
     except Exception as e:
@@ -118,10 +173,106 @@ def handle_pdf_footer(pdf_path: str, request: DocumentRequest):
                 rect.x1 - 10,
                 rect.y1 - 5
             )
-            page.insert_htmlbox(footer_rect, request.footer_html)
+            with profile_section("insert_htmlbox", external=True):
+                page.insert_htmlbox(footer_rect, request.footer_html)
         
-        doc.save(pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        with profile_section("pdf_save", external=True):
+            doc.save(pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
         doc.close()
         
     except Exception as e:
-        raise RuntimeError(f"Failed to add footer")
\ No newline at end of file
+        raise RuntimeError(f"Failed to add footer")
+
+def optimize_pdf(pdf_path: str, preset: str = "speed") -> dict:
+    """Rewrites the PDF with garbage collection, compression and optional
+    font subsetting / image downsampling. Returns size and timing stats.
+
+    This stage is best-effort: on failure the unoptimized file is kept."""
+    settings = PDF_OPTIMIZATION_PRESETS.get(preset)
+    size_before = os.path.getsize(pdf_path)
+    start = time.perf_counter()
+    if settings is not None:
+        try:
+            doc = fitz.open(pdf_path)
+
+            if settings["image_dpi"]:
+                with profile_section("pdf_downsample_images"):
+                    downsample_images(doc, settings["image_dpi"], settings["recompress_lossless"])
+
+            if settings["subset_fonts"]:
+                with profile_section("pdf_subset_fonts", external=True):
+                    doc.subset_fonts()
+
+            # garbage=4 also merges identical objects, deduplicating repeated
+            # image and font streams (e.g. the watermark on every page)
+            with profile_section("pdf_rewrite", external=True):
+                data = doc.tobytes(
+                    garbage=settings["garbage"],
+                    clean=True,
+                    deflate=settings["deflate"],
+                    deflate_images=settings["deflate_images"],
+                    deflate_fonts=settings["deflate_fonts"],
+                    use_objstms=settings["use_objstms"],
+                )
+            doc.close()
+
+            # Never replace the file with a larger rewrite
+            if len(data) < size_before:
+                with open(pdf_path + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(pdf_path + ".tmp", pdf_path)
+
+        except Exception:
+            logger.exception("PDF optimization (%s) failed, keeping unoptimized file", preset)
+
+    stats = {
+        "preset": preset,
+        "size_before": size_before,
+        "size_after": os.path.getsize(pdf_path),
+        "duration": time.perf_counter() - start,
+    }
+    logger.info(
+        "PDF optimization (%s): %d -> %d bytes in %.3fs",
+        preset, stats["size_before"], stats["size_after"], stats["duration"]
+    )
+    return stats
+
+def downsample_images(doc: fitz.Document, target_dpi: int, recompress_lossless: bool = False):
+    """Scales images displayed above the target DPI down to it and re-encodes
+    them, keeping a new stream only when it is smaller than the original."""
+    # Lowest effective resolution each image is drawn at, keyed by xref, so
+    # that its largest placement on either axis still meets the target
+    image_dpi = {}
+    for page in doc:
+        for info in page.get_image_info(xrefs=True):
+            xref = info["xref"]
+            if not xref or info["has-mask"]:
+                continue
+            a, b, c, d = info["transform"][:4]
+            shown_width, shown_height = math.hypot(a, b), math.hypot(c, d)
+            if shown_width <= 0 or shown_height <= 0:
+                continue
+            dpi = min(info["width"] * 72 / shown_width, info["height"] * 72 / shown_height)
+            image_dpi[xref] = min(image_dpi.get(xref, dpi), dpi)
+
+    for xref, dpi in image_dpi.items():
+        lossless = doc.xref_get_key(xref, "Filter")[1] not in ("/DCTDecode", "/JPXDecode")
+        if dpi <= target_dpi and not (recompress_lossless and lossless):
+            continue
+
+        pix = fitz.Pixmap(doc, xref)
+        if pix.alpha or pix.colorspace is None or pix.colorspace.n not in (1, 3):
+            continue
+        if dpi > target_dpi:
+            scale = target_dpi / dpi
+            pix = fitz.Pixmap(pix, math.ceil(pix.width * scale), math.ceil(pix.height * scale))
+        # Compare against what the original costs once the save deflates it
+        original = doc.xref_stream_raw(xref)
+        if doc.xref_get_key(xref, "Filter")[0] == "null":
+            original = zlib.compress(original)
+        candidates = [pix.tobytes("png")]
+        if recompress_lossless or not lossless:
+            candidates.append(pix.tobytes("jpg", jpg_quality=75))
+        stream = min(candidates, key=len)
+        if len(stream) < len(original):
+            doc[0].replace_image(xref, stream=stream)
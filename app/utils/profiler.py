@@ -0,0 +1,271 @@
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# Profiling is opt-in: either an admin sends the profile header, or a
+# request is picked at PROFILE_SAMPLE_RATE. Slow requests are always kept
+# with their stage timings, even when the stack sampler was not running.
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./temp/profiles")
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_SLOW_THRESHOLD = float(os.environ.get("PROFILE_SLOW_THRESHOLD_MS", "5000")) / 1000
+PROFILE_MAX_STORED = int(os.environ.get("PROFILE_MAX_STORED", "200"))
+
+PROFILE_HEADER = "X-Profile"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+SLOW_LOG_NAME = "slow_requests.log"
+
+logger = logging.getLogger(__name__)
+
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+_sampled_in_flight = set()
+
+
+class StackSampler:
+    """Samples the call stack of one thread at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL, max_depth: int = 64):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+
+class RequestProfile:
+    """Stage timings, sampled call stacks and allocation peak for one request."""
+
+    def __init__(self, method: str, path: str, sampled: bool):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.sections: Dict[str, dict] = {}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self.memory_peak = None
+        self.memory_peak_approximate = False
+        self.sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL) if sampled else None
+
+    def record(self, name: str, duration: float, external: bool):
+        section = self.sections.setdefault(name, {"calls": 0, "duration": 0.0, "external": external})
+        section["calls"] += 1
+        section["duration"] += duration
+
+    def to_dict(self) -> dict:
+        external = sum(s["duration"] for s in self.sections.values() if s["external"])
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "sampled": self.sampled,
+            "slow": self.duration >= PROFILE_SLOW_THRESHOLD,
+            "external_duration": external,
+            "python_duration": self.duration - external,
+            "memory_peak": self.memory_peak,
+            "memory_peak_approximate": self.memory_peak_approximate,
+            "sections": self.sections,
+            "stacks": dict(self.sampler.stacks.most_common()) if self.sampler else {},
+        }
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Checks a token against PROFILE_ADMIN_TOKEN in constant time."""
+    if not PROFILE_ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+def should_profile(headers) -> bool:
+    """Decides whether the full sampler should run for a request."""
+    requested = (headers.get(PROFILE_HEADER) or "").strip().lower() in ("1", "true")
+    if requested and is_admin_token(headers.get(ADMIN_TOKEN_HEADER)):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def start_profile(method: str, path: str, sampled: bool) -> RequestProfile:
+    """Starts a profile and makes it current for profile_section calls."""
+    global _tracemalloc_users, _tracemalloc_owned
+    profile = RequestProfile(method, path, sampled)
+    if sampled:
+        with _tracemalloc_lock:
+            # Leave tracing started elsewhere (e.g. PYTHONTRACEMALLOC) running
+            if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracemalloc_owned = True
+            _tracemalloc_users += 1
+            # The peak is process-wide: with other sampled requests in flight
+            # it cannot be reset without corrupting theirs, so all of them
+            # report a shared, approximate peak
+            if _sampled_in_flight:
+                profile.memory_peak_approximate = True
+                for other in _sampled_in_flight:
+                    other.memory_peak_approximate = True
+            else:
+                tracemalloc.reset_peak()
+            _sampled_in_flight.add(profile)
+        profile.sampler.start()
+    _current_profile.set(profile)
+    return profile
+
+def finish_profile(profile: RequestProfile) -> Optional[str]:
+    """Stops the profile and stores it if sampled or slow. Returns the stored id."""
+    global _tracemalloc_users, _tracemalloc_owned
+    profile.duration = time.perf_counter() - profile._start
+    _current_profile.set(None)
+    if profile.sampled:
+        profile.sampler.stop()
+        with _tracemalloc_lock:
+            profile.memory_peak = tracemalloc.get_traced_memory()[1]
+            _sampled_in_flight.discard(profile)
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0 and _tracemalloc_owned:
+                tracemalloc.stop()
+                _tracemalloc_owned = False
+
+    slow = profile.duration >= PROFILE_SLOW_THRESHOLD
+    if not (profile.sampled or slow):
+        return None
+
+    try:
+        data = profile.to_dict()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{profile.id}.json"), "w") as f:
+            json.dump(data, f)
+        if slow:
+            with open(os.path.join(PROFILE_DIR, SLOW_LOG_NAME), "a") as f:
+                f.write(json.dumps({key: data[key] for key in ("id", "method", "path", "started_at", "duration")}) + "\n")
+        prune_profiles()
+        return profile.id
+    except Exception:
+        logger.exception("Failed to store profile %s", profile.id)
+        return None
+
+@contextmanager
+def profile_section(name: str, external: bool = False):
+    """Times a block against the current request profile, if any.
+
+    Use external=True for time spent in engines outside the interpreter
+    (wkhtmltopdf, Aspose, MuPDF) so it is reported apart from Python time.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.record(name, time.perf_counter() - start, external)
+
+def prune_profiles():
+    """Deletes the oldest stored profiles beyond PROFILE_MAX_STORED and drops
+    slow-log entries whose profiles no longer exist."""
+    paths = [os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".json")]
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:max(len(paths) - PROFILE_MAX_STORED, 0)]:
+        try:
+            os.unlink(path)
+        except Exception:
+            pass
+
+    log_path = os.path.join(PROFILE_DIR, SLOW_LOG_NAME)
+    if not os.path.exists(log_path):
+        return
+    with open(log_path) as f:
+        lines = [line for line in f if line.strip()]
+    # Unparseable lines (e.g. a crash mid-append) are dropped on rewrite
+    entries = [entry for entry in map(_parse_log_line, lines) if entry]
+    kept = [
+        entry for entry in entries
+        if os.path.exists(os.path.join(PROFILE_DIR, f"{entry['id']}.json"))
+    ][-PROFILE_MAX_STORED:]
+    if len(kept) != len(lines):
+        with open(log_path + ".tmp", "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in kept)
+        os.replace(log_path + ".tmp", log_path)
+
+def _parse_log_line(line: str) -> Optional[dict]:
+    """Parses a slow-log entry, or returns None if the line is corrupt."""
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(entry, dict) or not isinstance(entry.get("id"), str):
+        return None
+    return entry
+
+def list_profiles() -> List[dict]:
+    """Returns summaries of stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    summaries = []
+    for name in os.listdir(PROFILE_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                data = json.load(f)
+        except Exception:
+            continue
+        summaries.append({key: data.get(key) for key in ("id", "method", "path", "started_at", "duration", "sampled", "slow")})
+    return sorted(summaries, key=lambda s: s["started_at"] or 0, reverse=True)
+
+def load_profile(profile_id: str) -> Optional[dict]:
+    """Loads a stored profile by id, or None if it does not exist."""
+    try:
+        if uuid.UUID(hex=profile_id).hex != profile_id:
+            return None
+    except ValueError:
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def read_slow_log(limit: int = 100) -> List[dict]:
+    """Returns the most recent slow-request log entries, newest first."""
+    path = os.path.join(PROFILE_DIR, SLOW_LOG_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        entries = deque((entry for entry in map(_parse_log_line, f) if entry), maxlen=limit)
+    return list(reversed(entries))
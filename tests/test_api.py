@@ -90,6 +90,34 @@ def test_generate_docx_with_watermark(cleanup_test_files):
     assert os.path.exists(output_path)
     assert os.path.getsize(output_path) > 1500  # Should be larger than basic DOCX
 
+def test_generate_pdf_optimization_presets(cleanup_test_files):
+    """Test that stronger optimization presets do not produce larger PDFs"""
+    sizes = {}
+    for preset in ["none", "speed", "size"]:
+        response = client.post("/generate-document", json={
+            "content_html": TEST_CONTENT,
+            "footer_html": TEST_FOOTER,
+            "document_type": "pdf",
+            "watermark_html": WATERMARK,
+            "pdf_optimization": preset
+        })
+        assert response.status_code == 200
+        sizes[preset] = len(response.content)
+
+    assert sizes["speed"] <= sizes["none"]
+    assert sizes["size"] <= sizes["speed"]
+
+def test_invalid_pdf_optimization(cleanup_test_files):
+    """Test invalid optimization preset handling"""
+    response = client.post("/generate-document", json={
+        "content_html": TEST_CONTENT,
+        "document_type": "pdf",
+        "pdf_optimization": "maximum"
+    })
+
+    assert response.status_code == 422
+    assert "pdf_optimization" in response.text
+
 def test_invalid_document_type(cleanup_test_files):
     """Test invalid document type handling"""
     response = client.post("/generate-document", json={
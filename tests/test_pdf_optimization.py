@@ -0,0 +1,155 @@
+import math
+import os
+import fitz
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import pdf_service
+from app.services.pdf_service import optimize_pdf
+
+client = TestClient(app)
+
+def noise_image(width: int, height: int) -> bytes:
+    """Random pixels, so that downsampling always gives a smaller stream."""
+    return fitz.Pixmap(fitz.csRGB, width, height, os.urandom(width * height * 3), False).tobytes("png")
+
+def make_image_pdf(path: str, pages: int = 3, image_width: int = 2000) -> str:
+    """Builds a PDF with a separately embedded copy of the same image on each page."""
+    image = noise_image(image_width, image_width // 2)
+
+    doc = fitz.open()
+    for _ in range(pages):
+        single = fitz.open()
+        page = single.new_page()
+        # 200pt wide, so a 2000px image is shown at 720 DPI
+        page.insert_image(fitz.Rect(100, 100, 300, 200), stream=image)
+        page.insert_text((72, 400), "Optimization test")
+        doc.insert_pdf(single)
+    doc.save(path)
+    return path
+
+def image_xrefs(path: str):
+    doc = fitz.open(path)
+    xrefs = {img[0]: (img[2], img[3]) for page in doc for img in page.get_images()}
+    doc.close()
+    return xrefs
+
+def placement_dpis(path: str):
+    """Lowest of the horizontal and vertical DPI for every image placement."""
+    doc = fitz.open(path)
+    dpis = []
+    for page in doc:
+        for info in page.get_image_info():
+            a, b, c, d = info["transform"][:4]
+            dpis.append(min(info["width"] * 72 / math.hypot(a, b), info["height"] * 72 / math.hypot(c, d)))
+    doc.close()
+    return dpis
+
+def test_optimize_pdf_downsamples_and_dedups(tmp_path):
+    """Test that repeated oversized images are merged and scaled to the target DPI"""
+    path = make_image_pdf(str(tmp_path / "images.pdf"))
+    assert len(image_xrefs(path)) == 3
+
+    stats = optimize_pdf(path, "size")
+
+    xrefs = image_xrefs(path)
+    assert len(xrefs) == 1
+    width, height = next(iter(xrefs.values()))
+    # 96 DPI over 200pt is ~267px
+    assert width == pytest.approx(267, abs=2)
+    assert stats["size_after"] < stats["size_before"]
+    assert stats["size_after"] == os.path.getsize(path)
+
+def test_optimize_pdf_reaches_target_dpi_below_double(tmp_path):
+    """Test that images shown under 2x the target DPI are still downsampled"""
+    # 400px over 200pt is 144 DPI
+    path = make_image_pdf(str(tmp_path / "images.pdf"), pages=1, image_width=400)
+
+    optimize_pdf(path, "size")
+
+    width, _ = next(iter(image_xrefs(path).values()))
+    assert width == pytest.approx(267, abs=2)
+
+def test_optimize_pdf_keeps_largest_placement_at_target(tmp_path):
+    """Test that an image drawn at two sizes is scaled for its largest placement"""
+    image = noise_image(1200, 600)
+    doc = fitz.open()
+    page = doc.new_page()
+    # 500pt wide is 172.8 DPI, the 72pt thumbnail is 1200 DPI
+    page.insert_image(fitz.Rect(50, 50, 550, 300), stream=image)
+    page.insert_image(fitz.Rect(50, 400, 122, 436), stream=image)
+    path = str(tmp_path / "two_sizes.pdf")
+    doc.save(path)
+    assert len(image_xrefs(path)) == 1
+
+    optimize_pdf(path, "size")
+
+    dpis = placement_dpis(path)
+    assert len(dpis) == 2
+    assert min(dpis) >= 96
+    assert min(dpis) == pytest.approx(96, abs=1)
+
+def test_optimize_pdf_non_proportional_placement(tmp_path):
+    """Test that a stretched image keeps the target DPI on both axes"""
+    doc = fitz.open()
+    page = doc.new_page()
+    # 864 DPI horizontally, 144 DPI vertically
+    page.insert_image(fitz.Rect(100, 100, 200, 400), stream=noise_image(1200, 600), keep_proportion=False)
+    path = str(tmp_path / "stretched.pdf")
+    doc.save(path)
+
+    optimize_pdf(path, "size")
+
+    dpis = placement_dpis(path)
+    assert min(dpis) >= 96
+    assert min(dpis) == pytest.approx(96, abs=1)
+
+def test_optimize_pdf_never_grows_file(tmp_path):
+    """Test that an already optimized file is left unchanged rather than rewritten larger"""
+    path = make_image_pdf(str(tmp_path / "images.pdf"))
+    optimize_pdf(path, "balanced")
+    with open(path, "rb") as f:
+        optimized = f.read()
+
+    stats = optimize_pdf(path, "size")
+
+    assert stats["size_after"] <= stats["size_before"]
+    assert os.path.getsize(path) <= len(optimized)
+
+def test_optimize_pdf_none_preset(tmp_path):
+    """Test that the 'none' preset leaves the file untouched"""
+    path = make_image_pdf(str(tmp_path / "images.pdf"), pages=1)
+    size = os.path.getsize(path)
+
+    stats = optimize_pdf(path, "none")
+
+    assert stats["size_before"] == stats["size_after"] == size
+
+def test_optimize_pdf_failure_keeps_file(tmp_path):
+    """Test that an optimization failure keeps the original file instead of raising"""
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"not a pdf")
+
+    stats = optimize_pdf(str(path), "balanced")
+
+    assert path.read_bytes() == b"not a pdf"
+    assert stats["size_after"] == stats["size_before"]
+
+def test_optimization_stats_in_response_headers(monkeypatch):
+    """Test that optimization sizes and stage time are exposed as response headers"""
+    def fake_from_string(html, output_path, options=None):
+        make_image_pdf(output_path, pages=2)
+    monkeypatch.setattr(pdf_service.pdfkit, "from_string", fake_from_string)
+
+    response = client.post("/generate-document", json={
+        "content_html": "<p>Test</p>",
+        "document_type": "pdf",
+        "pdf_optimization": "balanced"
+    })
+
+    assert response.status_code == 200
+    size_before = int(response.headers["X-PDF-Size-Before"])
+    size_after = int(response.headers["X-PDF-Size-After"])
+    assert size_after < size_before
+    assert size_after == len(response.content)
+    assert float(response.headers["X-PDF-Optimization-Ms"]) >= 0
@@ -0,0 +1,156 @@
+import time
+import tracemalloc
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils import profiler
+
+client = TestClient(app)
+ADMIN_TOKEN = "test-admin-token"
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    """Fixture to store profiles in a temporary directory with an admin token set"""
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiler, "PROFILE_ADMIN_TOKEN", ADMIN_TOKEN)
+    monkeypatch.setattr(profiler, "PROFILE_SAMPLE_RATE", 0)
+    yield tmp_path
+
+def test_profile_section_records_external_time(profiling):
+    """Test that sections are attributed to the current profile"""
+    profile = profiler.start_profile("POST", "/generate-document", sampled=True)
+    with profiler.profile_section("wkhtmltopdf", external=True):
+        time.sleep(0.05)
+    with profiler.profile_section("html_validation"):
+        sum(i * i for i in range(10000))
+    profile_id = profiler.finish_profile(profile)
+
+    data = profiler.load_profile(profile_id)
+    assert data["sections"]["wkhtmltopdf"]["calls"] == 1
+    assert data["sections"]["wkhtmltopdf"]["external"] is True
+    assert data["external_duration"] >= 0.05
+    assert data["sections"]["html_validation"]["external"] is False
+    assert data["memory_peak"] is not None
+    assert any("test_profile_section_records_external_time" in stack for stack in data["stacks"])
+
+def test_middleware_samples_request_thread(profiling, monkeypatch):
+    """Test that a header-profiled request collects stacks from the thread doing the work"""
+    monkeypatch.setattr(profiler, "PROFILE_INTERVAL", 0.001)
+    large_content = "<div>" + ("<p>Test paragraph</p>" * 20000) + "</div>"
+    response = client.post("/generate-document", headers={"X-Profile": "1", "X-Admin-Token": ADMIN_TOKEN}, json={
+        "content_html": large_content,
+        "document_type": "invalid_type"
+    })
+
+    assert response.status_code == 422
+    profile = profiler.load_profile(response.headers["X-Profile-Id"])
+    assert profile["sampled"] is True
+    assert profile["memory_peak"] > 0
+    assert profile["stacks"]
+    assert any("validate_content_html" in stack for stack in profile["stacks"])
+
+def test_tracemalloc_started_elsewhere_keeps_running(profiling):
+    """Test that the profiler does not stop tracing it did not start"""
+    tracemalloc.start()
+    try:
+        profiler.finish_profile(profiler.start_profile("GET", "/", sampled=True))
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    profiler.finish_profile(profiler.start_profile("GET", "/", sampled=True))
+    assert not tracemalloc.is_tracing()
+
+def test_unprofiled_fast_request_not_stored(profiling):
+    """Test that requests are not stored unless sampled or slow"""
+    response = client.get("/")
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert profiler.list_profiles() == []
+
+def test_profile_header_requires_admin_token(profiling):
+    """Test that the profile header is ignored without a valid admin token"""
+    response = client.get("/", headers={"X-Profile": "1", "X-Admin-Token": "wrong"})
+    assert "X-Profile-Id" not in response.headers
+
+    for value in ["0", "false", "no"]:
+        response = client.get("/", headers={"X-Profile": value, "X-Admin-Token": ADMIN_TOKEN})
+        assert "X-Profile-Id" not in response.headers
+
+    response = client.get("/", headers={"X-Profile": "1", "X-Admin-Token": ADMIN_TOKEN})
+    assert "X-Profile-Id" in response.headers
+
+def test_slow_request_logged(profiling, monkeypatch):
+    """Test that requests above the latency threshold are kept automatically"""
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_THRESHOLD", 0)
+    response = client.post("/generate-document", json={
+        "content_html": "<p>Test</p>",
+        "document_type": "invalid_type"
+    })
+
+    assert response.status_code == 422
+    profile_id = response.headers["X-Profile-Id"]
+
+    headers = {"X-Admin-Token": ADMIN_TOKEN}
+    slow = client.get("/admin/slow-requests", headers=headers).json()
+    assert slow[0]["id"] == profile_id
+    assert slow[0]["path"] == "/generate-document"
+
+    profile = client.get(f"/admin/profiles/{profile_id}", headers=headers).json()
+    assert profile["slow"] is True
+    assert profile["sampled"] is False
+    assert profile["sections"]["html_validation"]["calls"] == 1
+
+def test_slow_log_pruned_with_profiles(profiling, monkeypatch):
+    """Test that the slow-request log only keeps entries for stored profiles"""
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_THRESHOLD", 0)
+    monkeypatch.setattr(profiler, "PROFILE_MAX_STORED", 3)
+    profile_ids = [client.get("/").headers["X-Profile-Id"] for _ in range(6)]
+
+    headers = {"X-Admin-Token": ADMIN_TOKEN}
+    slow = client.get("/admin/slow-requests", headers=headers).json()
+    assert [entry["id"] for entry in slow] == profile_ids[:-4:-1]
+    assert len(client.get("/admin/profiles", headers=headers).json()) == 3
+
+    assert len(client.get("/admin/slow-requests?limit=1", headers=headers).json()) == 1
+    assert client.get("/admin/slow-requests?limit=0", headers=headers).status_code == 422
+
+def test_corrupt_slow_log_lines_skipped(profiling, monkeypatch):
+    """Test that a truncated slow-log line does not break logging or the admin endpoint"""
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_THRESHOLD", 0)
+    first_id = client.get("/").headers["X-Profile-Id"]
+    with open(profiling / profiler.SLOW_LOG_NAME, "a") as f:
+        f.write('{"id": "trunc\n')
+    second_id = client.get("/").headers["X-Profile-Id"]
+
+    headers = {"X-Admin-Token": ADMIN_TOKEN}
+    response = client.get("/admin/slow-requests", headers=headers)
+    assert response.status_code == 200
+    assert [entry["id"] for entry in response.json()] == [second_id, first_id]
+    assert "trunc" not in (profiling / profiler.SLOW_LOG_NAME).read_text()
+
+def test_overlapping_profiles_mark_memory_peak_approximate(profiling):
+    """Test that concurrent sampled profiles flag their shared memory peak"""
+    alone = profiler.start_profile("GET", "/", sampled=True)
+    profiler.finish_profile(alone)
+    assert alone.memory_peak_approximate is False
+
+    first = profiler.start_profile("GET", "/", sampled=True)
+    second = profiler.start_profile("GET", "/", sampled=True)
+    first_id = profiler.finish_profile(first)
+    profiler.finish_profile(second)
+
+    assert first.memory_peak_approximate is True
+    assert second.memory_peak_approximate is True
+    assert profiler.load_profile(first_id)["memory_peak_approximate"] is True
+
+def test_admin_endpoints_require_token(profiling):
+    """Test admin endpoint authentication and missing profiles"""
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    headers = {"X-Admin-Token": ADMIN_TOKEN}
+    assert client.get("/admin/profiles", headers=headers).json() == []
+    assert client.get("/admin/profiles/../secret", headers=headers).status_code == 404
+    assert client.get("/admin/profiles/0123456789abcdef0123456789abcdef", headers=headers).status_code == 404